@@ -5,15 +5,56 @@ Uses /tmp for storage so it works on Streamlit Cloud (data may not persist acros
 
 import os
 import csv
+import atexit
+import concurrent.futures
+import functools
+import threading
 import time
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Storage under /tmp for deployed apps (Streamlit Cloud)
 BASE_DIR = Path(os.environ.get("ADMIN_DATA_DIR", "/tmp"))
 VISITOR_LOG = BASE_DIR / "sentiment_visitor_log.csv"
 UPLOADS_DIR = BASE_DIR / "sentiment_uploads"
 
+# Shared keep-alive session for ipinfo.io lookups (avoids a TCP+TLS handshake per visitor)
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=2, backoff_factor=0.2)),
+)
+
+# Visitor log is kept open in append mode and flushed every LOG_FLUSH_EVERY rows (and at exit)
+LOG_FLUSH_EVERY = 16
+_LOG_LOCK = threading.Lock()
+_LOG_FH = None
+_LOG_WRITER = None
+_LOG_PENDING = 0
+# Shared across sessions; geolocation + CSV write run here instead of on the script thread
+_LOG_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="visitor-log")
+
+# Logged values that are shown as — in the admin panel
+_MISSING_VALUES = frozenset(("undefined", "unknown", "none"))
+
+
+class _SafeNameTable(dict):
+    """str.translate table: keep alphanumerics and ._-, map everything else to _ (memoized)."""
+
+    def __missing__(self, codepoint: int) -> str:
+        ch = chr(codepoint)
+        value = ch if ch.isalnum() or ch in "._-" else "_"
+        self[codepoint] = value
+        return value
+
+
+_SAFE_TRANS = _SafeNameTable()
+
 
 def _ensure_dirs():
     UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
@@ -39,17 +80,44 @@ def _request_meta() -> dict:
                     val = val.strip()
                     if not val:
                         continue
-                    meta[key] = val
-                    meta[key.upper().replace("-", "_")] = val
+                    # ipware only looks up canonical HTTP_<UPPER> keys (plus REMOTE_ADDR)
+                    key = key.upper().replace("-", "_")
                     if not key.startswith("HTTP_"):
-                        meta["HTTP_" + key.upper().replace("-", "_")] = val
+                        key = "HTTP_" + key
+                    meta[key] = val
     except Exception:
         pass
     return meta
 
 
+def _session_state():
+    """Streamlit session_state, or None outside a Streamlit script run."""
+    try:
+        import streamlit as _st
+        return _st.session_state
+    except Exception:
+        return None
+
+
 def get_client_ip() -> Optional[str]:
-    """Get client IP using python-ipware (Streamlit request → meta → ipware)."""
+    """Get client IP using python-ipware (Streamlit request → meta → ipware). Cached per session."""
+    state = _session_state()
+    try:
+        if state is not None and "_client_ip" in state:
+            return state["_client_ip"]
+    except Exception:
+        state = None
+    ip = _resolve_client_ip()
+    if ip is not None and state is not None:
+        try:
+            state["_client_ip"] = ip
+        except Exception:
+            pass
+    return ip
+
+
+def _resolve_client_ip() -> Optional[str]:
+    """Resolve client IP from request headers via python-ipware."""
     try:
         from python_ipware import IpWare
         meta = _request_meta()
@@ -68,75 +136,137 @@ def get_client_ip() -> Optional[str]:
     return None
 
 
+def _lookup_location_uncached(ip: str) -> str:
+    """Query ipinfo.io for a city/region/country string. Raises on network or HTTP errors."""
+    resp = _SESSION.get(
+        f"https://ipinfo.io/{ip}/json",
+        timeout=3,
+        headers={"User-Agent": "StreamlitApp/1.0"},
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    city = data.get("city") or ""
+    region = data.get("region") or ""
+    country = data.get("country") or ""
+    parts = [p for p in (city, region, country) if p]
+    return ", ".join(parts) if parts else data.get("loc", "Unknown")
+
+
+@functools.lru_cache(maxsize=4096)
+def _lookup_location(ip: str, day: int) -> str:
+    """Cached lookup; `day` is part of the key so entries expire after ~24 hours. Errors are not cached."""
+    return _lookup_location_uncached(ip)
+
+
 def get_ip_location(ip: Optional[str]) -> str:
     """Get city/location string for IP using ipinfo.io (no token needed for basic)."""
     s = (ip or "").strip().lower()
     if not s or s in ("127.0.0.1", "localhost", "::1", "unknown", "undefined", "none", "—"):
         return "Local" if ip and "127" in str(ip) else "Unknown"
     try:
-        import urllib.request
-        url = f"https://ipinfo.io/{ip}/json"
-        req = urllib.request.Request(url, headers={"User-Agent": "StreamlitApp/1.0"})
-        with urllib.request.urlopen(req, timeout=3) as resp:
-            import json
-            data = json.loads(resp.read().decode())
-            city = data.get("city") or ""
-            region = data.get("region") or ""
-            country = data.get("country") or ""
-            parts = [p for p in (city, region, country) if p]
-            return ", ".join(parts) if parts else data.get("loc", "Unknown")
+        return _lookup_location(str(ip).strip(), int(time.time() // 86400))
     except Exception:
         return "Unknown"
 
 
-def log_visitor():
-    """Append current visitor IP, location, and timestamp to log. Call once per session."""
-    ip = get_client_ip()
-    if ip is None or not str(ip).strip() or str(ip).lower() in ("undefined", "none"):
-        ip = "—"
-    city = get_ip_location(ip)
-    if not city or str(city).lower() in ("undefined", "none"):
-        city = "—"
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
-    _ensure_dirs()
-    file_exists = VISITOR_LOG.exists()
-    with open(VISITOR_LOG, "a", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        if not file_exists:
-            w.writerow(["timestamp", "ip", "city"])
-        w.writerow([timestamp, ip, city])
+def _get_log_writer():
+    """Open the visitor log once (header on first write) and return its csv.writer. Call under _LOG_LOCK."""
+    global _LOG_FH, _LOG_WRITER
+    if _LOG_WRITER is None:
+        _ensure_dirs()
+        _LOG_FH = open(VISITOR_LOG, "a", newline="", encoding="utf-8", buffering=1 << 16)
+        _LOG_WRITER = csv.writer(_LOG_FH)
+        if os.path.getsize(VISITOR_LOG) == 0:
+            _LOG_WRITER.writerow(["timestamp", "ip", "city"])
+        atexit.register(flush_visitor_log)
+    return _LOG_WRITER
+
+
+def flush_visitor_log():
+    """Write any buffered visitor rows to disk."""
+    global _LOG_PENDING
+    with _LOG_LOCK:
+        if _LOG_FH is not None:
+            _LOG_FH.flush()
+        _LOG_PENDING = 0
+
+
+def log_visitor(ip: Optional[str] = None):
+    """
+    Append visitor IP, location, and timestamp to log. Call once per session.
+    Resolves the IP from the current request when not given. Errors are logged, not raised.
+    """
+    global _LOG_PENDING
+    try:
+        if ip is None:
+            ip = get_client_ip()
+        if ip is None or not str(ip).strip() or str(ip).lower() in ("undefined", "none"):
+            ip = "—"
+        city = get_ip_location(ip)
+        if not city or str(city).lower() in ("undefined", "none"):
+            city = "—"
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S UTC", time.gmtime())
+        with _LOG_LOCK:
+            _get_log_writer().writerow([timestamp, ip, city])
+            _LOG_PENDING += 1
+            if _LOG_PENDING >= LOG_FLUSH_EVERY:
+                _LOG_FH.flush()
+                _LOG_PENDING = 0
+    except Exception as e:
+        print(f"[admin_utils] log_visitor: error — {e}")
+
+
+def log_visitor_in_background() -> concurrent.futures.Future:
+    """
+    Log the visit without blocking the page. The IP is read here on the script thread,
+    since Streamlit request context isn't available in worker threads.
+    """
+    return _LOG_EXECUTOR.submit(log_visitor, get_client_ip() or "—")
 
 
 def save_upload(uploaded_file, original_name: str) -> str:
     """Save a copy of uploaded file to admin storage. Returns stored filename."""
     _ensure_dirs()
-    safe_name = "".join(c if c.isalnum() or c in "._-" else "_" for c in original_name)
+    safe_name = original_name.translate(_SAFE_TRANS)
     stored_name = f"{safe_name}_{int(time.time())}"
     path = UPLOADS_DIR / stored_name
     path.write_bytes(uploaded_file.getvalue())
     return stored_name
 
 
-def get_visitor_log() -> list:
-    """Return list of dicts: timestamp, ip, city. Normalizes missing/undefined to —."""
-    if not VISITOR_LOG.exists():
-        return []
-    rows = []
-    place = "—"
-    with open(VISITOR_LOG, "r", encoding="utf-8", newline="") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            normalized = {
-                "timestamp": (row.get("timestamp") or "").strip() or place,
-                "ip": (row.get("ip") or "").strip() or place,
-                "city": (row.get("city") or "").strip() or place,
-            }
-            if normalized["ip"].lower() in ("undefined", "unknown", "none"):
-                normalized["ip"] = place
-            if normalized["city"].lower() in ("undefined", "unknown", "none"):
-                normalized["city"] = place
-            rows.append(normalized)
-    return rows
+@functools.lru_cache(maxsize=4)
+def _read_visitor_log(path_str: str, mtime_ns: int, size: int) -> list:
+    """Parse and normalize the visitor log; mtime/size are cache keys so edits invalidate it."""
+    # Split rows like csv.DictReader did: extra fields are dropped, short rows padded,
+    # blank lines skipped — so malformed entries still show up in the admin panel
+    with open(path_str, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return []
+        width = len(header)
+        rows = [(row + [""] * width)[:width] for row in reader if row]
+    df = pd.DataFrame(rows, columns=header, dtype=str)
+    df = df.reindex(columns=["timestamp", "ip", "city"], fill_value="")
+    for col in df.columns:
+        values = df[col].str.strip()
+        missing = values.eq("") | values.str.lower().isin(_MISSING_VALUES)
+        df[col] = values.mask(missing, "—")
+    return df.to_dict(orient="records")
+
+
+def get_visitor_log() -> Tuple[Optional[tuple], list]:
+    """
+    Return (key, rows). rows is a list of dicts: timestamp, ip, city, with missing/undefined
+    normalized to —. key is the log's (mtime_ns, size) the rows were read under, or None.
+    """
+    flush_visitor_log()
+    try:
+        st = os.stat(VISITOR_LOG)
+    except FileNotFoundError:
+        return None, []
+    key = (st.st_mtime_ns, st.st_size)
+    return key, _read_visitor_log(str(VISITOR_LOG), *key)
 
 
 def get_uploaded_files() -> list:
@@ -144,4 +274,4 @@ def get_uploaded_files() -> list:
     _ensure_dirs()
     if not UPLOADS_DIR.exists():
         return []
-    return [(p.name, p) for p in sorted(UPLOADS_DIR.iterdir(), key=lambda x: -x.stat().st_mtime)]
+    return [(p.name, p) for p in sorted(UPLOADS_DIR.iterdir(), key=lambda x: x.stat().st_mtime, reverse=True)]
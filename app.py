@@ -20,11 +20,12 @@ from csv_utils import (
     to_csv_bytes,
 )
 from admin_utils import (
-    log_visitor,
+    log_visitor_in_background,
     save_upload,
     get_visitor_log,
     get_uploaded_files,
 )
+from sentiment import get_pipeline_cached
 
 
 def _admin_secret():
@@ -36,22 +37,26 @@ def _admin_secret():
     return os.environ.get("ADMIN_SECRET", "")
 
 
+@st.cache_data(show_spinner=False, max_entries=1)
+def _visitor_log_csv(log_key, _df_visitors: pd.DataFrame) -> bytes:
+    """CSV bytes of the visitor log; cached on the log's (mtime, size), the frame isn't hashed."""
+    return to_csv_bytes(_df_visitors)
+
+
 def _render_admin():
     """Admin panel: visitor log (IP, city, timestamp) and downloadable uploads."""
     st.title("Admin panel")
     st.caption("Visitor log and uploaded files from the deployed app.")
 
     st.subheader("Visitor log (IP, city, timestamp)")
-    visitors = get_visitor_log()
+    log_key, visitors = get_visitor_log()
     if not visitors:
         st.info("No visitor entries yet.")
     else:
-        df_visitors = pd.DataFrame(visitors).fillna("—")
+        df_visitors = pd.DataFrame(visitors)
         st.dataframe(df_visitors, width="stretch", hide_index=True)
-        import io
-        buf = io.BytesIO()
-        pd.DataFrame(visitors).to_csv(buf, index=False)
-        st.download_button("Download visitor log as CSV", data=buf.getvalue(), file_name="visitor_log.csv", mime="text/csv")
+        csv_bytes = _visitor_log_csv(log_key, df_visitors)
+        st.download_button("Download visitor log as CSV", data=csv_bytes, file_name="visitor_log.csv", mime="text/csv")
 
     st.subheader("Uploaded files (CSV or any)")
     files = get_uploaded_files()
@@ -81,14 +86,18 @@ if secret and admin_param == secret:
     _render_admin()
     st.stop()
 
-# Main app: log visitor once per session, then show sentiment UI
+# Main app: log visitor once per session (in the background), then show sentiment UI
 if "visitor_logged" not in st.session_state:
     try:
-        log_visitor()
+        log_visitor_in_background()
         st.session_state["visitor_logged"] = True
     except Exception:
         st.session_state["visitor_logged"] = True
 
+# Warm the shared model once per worker so the first analysis doesn't pay the load
+with st.spinner("Loading sentiment model…"):
+    get_pipeline_cached()
+
 st.title("Customer review sentiment analysis")
 st.markdown("Upload a CSV with a text column (e.g. reviews). We assign **positive**, **neutral**, or **negative** and optional confidence.")
 
@@ -2,33 +2,49 @@
 CSV handling: read uploads, detect text column, add sentiment and confidence, export.
 """
 
-import io
 from typing import Optional, List, Tuple
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 from sentiment import analyze_batch
 
 
-# Common column names that likely contain review text
+# Common column names that likely contain review text (longest first, so specific names win)
 TEXT_CANDIDATES = (
-    "review", "reviews", "text", "content", "comment", "comments",
-    "feedback", "message", "body", "description", "review_text", "customer_review",
+    "customer_review", "review_text", "description", "comments", "feedback",
+    "reviews", "content", "comment", "message", "review", "text", "body",
 )
+_TEXT_CAND_SET = frozenset(TEXT_CANDIDATES)
+
+# Rows sampled when guessing the text column by median length
+LENGTH_SAMPLE_ROWS = 1000
 
 
 def detect_text_column(df: pd.DataFrame) -> Optional[str]:
     """Return the first column name that looks like review text, or None."""
-    cols_lower = [c.lower().strip() for c in df.columns]
+    cols_lower = [str(c).lower().strip() for c in df.columns]
+    for i, col in enumerate(cols_lower):
+        if col in _TEXT_CAND_SET:
+            return df.columns[i]
     for candidate in TEXT_CANDIDATES:
         for i, col in enumerate(cols_lower):
             if candidate in col or col in candidate:
                 return df.columns[i]
     if len(df.columns) == 1:
         return df.columns[0]
-    for col in df.columns:
-        if df[col].dtype == object and df[col].astype(str).str.len().median() > 20:
-            return col
+    # Median text length over a head sample is plenty for this heuristic on large uploads
+    head = df.head(LENGTH_SAMPLE_ROWS)
+    text_cols = [
+        c for c in head.columns
+        if pd.api.types.is_object_dtype(head[c]) or pd.api.types.is_string_dtype(head[c])
+    ]
+    if not text_cols:
+        return None
+    lengths = head[text_cols].apply(lambda s: s.astype(str).str.len().median())
+    if lengths.max() > 20:
+        return lengths.idxmax()
     return None
 
 
@@ -40,22 +56,57 @@ def run_sentiment_on_df(
     Add 'sentiment' and 'sentiment_confidence' columns using the given text column.
     Returns a new DataFrame.
     """
-    texts = df[text_column].fillna("").astype(str).tolist()
-    results = analyze_batch(texts)
+    texts = df[text_column].fillna("").astype(str).str.strip().str.slice(0, 512)
+    # Only unique texts go through the model; duplicates reuse the same result
+    unique_texts = texts.unique().tolist()
+    by_text = dict(zip(unique_texts, analyze_batch(unique_texts)))
+    results = [by_text[t] for t in texts]
     out = df.copy()
     out["sentiment"] = [r[0] for r in results]
     out["sentiment_confidence"] = [r[1] for r in results]
     return out
 
 
+def _read_arrow_table(uploaded_file, column_types=None):
+    """Parse the upload with pyarrow.csv; column_types forces types for the named columns."""
+    uploaded_file.seek(0)
+    return pacsv.read_csv(
+        uploaded_file,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=1 << 20),
+        # Quoted multi-line reviews must not be split at block boundaries
+        parse_options=pacsv.ParseOptions(newlines_in_values=True),
+        # Empty / N/A cells stay missing, as with pandas
+        convert_options=pacsv.ConvertOptions(strings_can_be_null=True, column_types=column_types),
+    )
+
+
 def read_uploaded_csv(uploaded_file) -> pd.DataFrame:
-    """Read an uploaded Streamlit file (BytesIO) as CSV."""
-    return pd.read_csv(io.BytesIO(uploaded_file.getvalue()))
+    """Read an uploaded Streamlit file (BytesIO) as CSV; pyarrow first, pandas for quirky files."""
+    try:
+        table = _read_arrow_table(uploaded_file)
+        names = table.column_names
+        # pandas renames duplicate (review, review.1) and blank ("Unnamed: 0") headers
+        if "" not in names and len(set(names)) == len(names):
+            # pandas leaves dates/times as text; re-read those columns as strings so the
+            # downloaded CSV keeps the user's original formatting
+            temporal = {
+                f.name: pa.string() for f in table.schema
+                if pa.types.is_temporal(f.type)
+            }
+            if temporal:
+                table = _read_arrow_table(uploaded_file, column_types=temporal)
+            df = table.to_pandas()
+            for f in table.schema:
+                # All-empty columns: NaN floats like pandas, not pyarrow's null type
+                if pa.types.is_null(f.type):
+                    df[f.name] = df[f.name].astype("float64")
+            return df
+    except pa.ArrowException:
+        pass
+    uploaded_file.seek(0)
+    return pd.read_csv(uploaded_file)
 
 
 def to_csv_bytes(df: pd.DataFrame) -> bytes:
     """Export DataFrame to CSV as bytes for download."""
-    buf = io.BytesIO()
-    df.to_csv(buf, index=False)
-    buf.seek(0)
-    return buf.getvalue()
+    return df.to_csv(index=False).encode("utf-8")
@@ -1,50 +1,133 @@
 """
 Sentiment analysis using a pre-trained NLP model.
 Maps model output to positive, neutral, or negative with optional confidence.
-Falls back to VADER if the transformer pipeline cannot be loaded (e.g. torch version).
+Prefers an INT8-quantized ONNX Runtime model; falls back to the FP32 transformers pipeline,
+then to VADER if the transformer pipeline cannot be loaded (e.g. torch version).
 """
 
+import contextlib
+import functools
+import os
+import shutil
+import tempfile
+from pathlib import Path
 from typing import List, Tuple
 
-_pipeline = None
-_use_vader = None
+import numpy as np
 
+try:
+    import streamlit as st
+    # Shared across sessions in one Streamlit worker
+    _cache_resource = st.cache_resource(show_spinner=False)
+except Exception:
+    _cache_resource = functools.lru_cache(maxsize=None)
 
-def _get_pipeline():
-    """Load the pre-trained sentiment pipeline once, or None to use VADER fallback."""
-    global _pipeline, _use_vader
-    if _use_vader is False and _pipeline is not None:
-        return _pipeline
-    if _use_vader is True:
-        return None
+MODEL_NAME = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+# Exported + quantized ONNX model is cached here so the export runs once per machine
+ONNX_DIR = Path(os.environ.get("SENTIMENT_ONNX_DIR", "/tmp/sentiment_onnx"))
+
+# Lowercased model labels (incl. raw LABEL_0/1/2 from some checkpoints) → our labels
+_LABEL_MAP = {
+    "positive": "positive",
+    "pos": "positive",
+    "negative": "negative",
+    "neg": "negative",
+    "label_0": "negative",
+    "label_1": "neutral",
+    "label_2": "positive",
+}
+
+
+def _build_onnx_pipeline():
+    """Export the model to ONNX, quantize weights to INT8 (cached), and wrap it in a pipeline."""
+    import onnxruntime
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer, pipeline
+    quantized = ONNX_DIR / "model_quantized.onnx"
+    if not quantized.exists():
+        # Build in a private temp dir and os.replace() into place, so an interrupted run or a
+        # concurrent worker never leaves a truncated model behind. The model file goes last:
+        # once it exists, its config does too.
+        ONNX_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=ONNX_DIR))
+        try:
+            exported = ORTModelForSequenceClassification.from_pretrained(MODEL_NAME, export=True)
+            exported.save_pretrained(tmp_dir)
+            tmp_quantized = tmp_dir / quantized.name
+            quantize_dynamic(tmp_dir / "model.onnx", tmp_quantized, weight_type=QuantType.QInt8)
+            for f in tmp_dir.iterdir():
+                if f.suffix != ".onnx":
+                    os.replace(f, ONNX_DIR / f.name)
+            os.replace(tmp_quantized, quantized)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    sess_options = onnxruntime.SessionOptions()
+    sess_options.intra_op_num_threads = os.cpu_count() or 1
+    model = ORTModelForSequenceClassification.from_pretrained(
+        ONNX_DIR, file_name=quantized.name, session_options=sess_options,
+    )
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    return pipeline("sentiment-analysis", model=model, tokenizer=tokenizer, top_k=None)
+
+
+def _tune_torch_threads():
+    """Pin torch intra-op threads to the container CPU count (OMP_NUM_THREADS wins if set)."""
+    import torch
+    try:
+        torch.set_num_threads(int(os.environ.get("OMP_NUM_THREADS", os.cpu_count() or 2)))
+        # Only allowed before any inter-op parallel work has started
+        torch.set_num_interop_threads(1)
+    except (ValueError, RuntimeError):
+        pass
+
+
+def _inference_mode():
+    """torch.inference_mode() when torch is installed, else a no-op context."""
+    try:
+        import torch
+        return torch.inference_mode()
+    except ImportError:
+        return contextlib.nullcontext()
+
+
+@_cache_resource
+def get_pipeline_cached():
+    """Load the pre-trained sentiment pipeline once per process, or None to use VADER fallback."""
     try:
-        import numpy as np
         if getattr(np, "__version__", "").startswith("2."):
             raise RuntimeError("NumPy 2.x is incompatible with this torch build; use VADER.")
-        from transformers import pipeline
-        _pipeline = pipeline(
-            "sentiment-analysis",
-            model="cardiffnlp/twitter-roberta-base-sentiment-latest",
-            top_k=None,
-        )
-        _use_vader = False
-        return _pipeline
+        try:
+            return _build_onnx_pipeline()
+        except Exception as e:
+            print(f"[sentiment] get_pipeline_cached: ONNX error, using FP32 pipeline — {e}")
+            from transformers import pipeline
+            pipe = pipeline("sentiment-analysis", model=MODEL_NAME, top_k=None)
+            _tune_torch_threads()
+            return pipe
     except BaseException:
-        _use_vader = True
         return None
 
 
-def _analyze_vader(text: str) -> Tuple[str, float]:
-    """Use VADER for sentiment when transformer is unavailable."""
+@_cache_resource
+def get_vader_cached():
+    """Load the VADER analyzer once per process."""
     from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-    if not hasattr(_analyze_vader, "_analyzer"):
-        _analyze_vader._analyzer = SentimentIntensityAnalyzer()
-    compound = _analyze_vader._analyzer.polarity_scores(str(text).strip()[:512])["compound"]
-    if compound >= 0.05:
-        return "positive", round(min(1.0, 0.5 + compound / 2), 4)
-    if compound <= -0.05:
-        return "negative", round(min(1.0, 0.5 + abs(compound) / 2), 4)
-    return "neutral", round(0.5 + (0.5 - abs(compound)), 4)
+    return SentimentIntensityAnalyzer()
+
+
+def _analyze_vader_batch(texts: List[str]) -> List[Tuple[str, float]]:
+    """Use VADER for sentiment when transformer is unavailable; labels/confidences are vectorized."""
+    analyzer = get_vader_cached()
+    compound = np.fromiter(
+        (analyzer.polarity_scores(t[:512])["compound"] for t in texts),
+        dtype=np.float64,
+        count=len(texts),
+    )
+    magnitude = np.abs(compound)
+    labels = np.where(compound >= 0.05, "positive", np.where(compound <= -0.05, "negative", "neutral"))
+    confidence = np.where(magnitude >= 0.05, np.minimum(1.0, 0.5 + magnitude / 2), 1.0 - magnitude)
+    return list(zip(labels.tolist(), np.round(confidence, 4).tolist()))
 
 
 def analyze_text(text: str) -> Tuple[str, float]:
@@ -52,32 +135,33 @@ def analyze_text(text: str) -> Tuple[str, float]:
     Analyze a single text and return (label, confidence).
     Label is one of: positive, neutral, negative.
     """
-    if not text or not str(text).strip():
-        return "neutral", 0.0
-    pipe = _get_pipeline()
-    if pipe is None:
-        return _analyze_vader(text)
-    result = pipe(str(text).strip()[:512])[0]
-    if isinstance(result, list):
-        by_label = {r["label"].lower(): r["score"] for r in result}
-    else:
-        by_label = {result["label"].lower(): result["score"]}
-    label = max(by_label, key=by_label.get)
-    confidence = by_label[label]
-    normalized = _normalize_label(label)
-    return normalized, round(confidence, 4)
+    return analyze_batch([text])[0]
 
 
 def _normalize_label(label: str) -> str:
     """Map model labels to positive, neutral, negative."""
-    label = label.lower()
-    if label in ("positive", "pos"):
-        return "positive"
-    if label in ("negative", "neg"):
-        return "negative"
-    return "neutral"
+    return _LABEL_MAP.get(label.lower(), "neutral")
 
 
 def analyze_batch(texts: List[str]) -> List[Tuple[str, float]]:
-    """Analyze a list of texts; returns list of (label, confidence)."""
-    return [analyze_text(t) for t in texts]
+    """
+    Analyze a list of texts; returns list of (label, confidence).
+    Non-empty texts go through the pipeline in one batched call (SENTIMENT_BATCH, default 32).
+    """
+    results: List[Tuple[str, float]] = [("neutral", 0.0)] * len(texts)
+    cleaned = [str(t).strip()[:512] if t else "" for t in texts]
+    indices = [i for i, t in enumerate(cleaned) if t]
+    if not indices:
+        return results
+    pipe = get_pipeline_cached()
+    if pipe is None:
+        for i, r in zip(indices, _analyze_vader_batch([cleaned[i] for i in indices])):
+            results[i] = r
+        return results
+    batch_size = int(os.environ.get("SENTIMENT_BATCH", "32"))
+    with _inference_mode():
+        outputs = pipe([cleaned[i] for i in indices], batch_size=batch_size, truncation=True)
+    for i, out in zip(indices, outputs):
+        best = max(out, key=lambda x: x["score"]) if isinstance(out, list) else out
+        results[i] = (_normalize_label(best["label"]), round(best["score"], 4))
+    return results